@@ -0,0 +1,92 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import trascrivi_locale as tl
+
+SR = tl.SAMPLE_RATE
+WORD = 1.5  # secondi per "parola" nel segnale di prova
+
+
+def _signal(n_words):
+    # ogni parola è un tratto a valore costante: il modello finto la riconosce
+    # dal valore, indipendentemente da dove il buffer è stato tagliato
+    return np.concatenate([np.full(int(WORD * SR), (i + 1) / 1000.0, dtype=np.float32)
+                           for i in range(n_words)])
+
+
+class RunModel:
+    # un segmento per ogni tratto costante; un tratto che tocca la fine del
+    # buffer è una parola ancora incompleta e cambia testo a ogni chiamata
+    def __init__(self, stable=True):
+        self.stable = stable
+        self.calls = 0
+
+    def transcribe(self, audio, **kw):
+        self.calls += 1
+        audio = np.asarray(audio)
+        segs = []
+        if len(audio):
+            edges = np.flatnonzero(np.diff(audio)) + 1
+            bounds = [0] + edges.tolist() + [len(audio)]
+            for a, b in zip(bounds, bounds[1:]):
+                if audio[a] == 0.0:
+                    continue
+                word = int(round(audio[a] * 1000)) - 1
+                text = f" w{word}"
+                if b == len(audio) or not self.stable:
+                    text += f"~{self.calls}"
+                segs.append(SimpleNamespace(start=a / SR, end=b / SR, text=text))
+        return iter(segs), None
+
+
+def _feed(live, audio, latency):
+    step = int(latency * SR)
+    for i in range(0, len(audio), step):
+        live.feed(audio[i:i + step])
+
+
+def test_segments_are_committed_once_with_original_times():
+    committed = []
+    live = tl.LiveTranscriber(RunModel(), latency=1.0, on_commit=committed.append)
+    _feed(live, _signal(10), 1.0)
+    # prima della fine le parole complete sono già confermate in ordine
+    assert [s["text"].strip() for s in committed] == [f"w{i}" for i in range(len(committed))]
+    assert len(committed) >= 7
+    live.finish()
+
+    texts = [s["text"].strip().split("~")[0] for s in committed]
+    assert texts == [f"w{i}" for i in range(10)]
+    for i, seg in enumerate(committed):
+        assert seg["start"] == pytest.approx(i * WORD)
+        assert seg["end"] == pytest.approx((i + 1) * WORD)
+
+
+def test_forced_commit_trims_buffer_past_max_window():
+    committed = []
+    live = tl.LiveTranscriber(RunModel(stable=False), latency=1.0, on_commit=committed.append)
+    step = SR
+    audio = _signal(30)  # 45 s senza mai un accordo tra due ipotesi
+    for i in range(0, len(audio), step):
+        live.feed(audio[i:i + step])
+        assert len(live.buffer) / SR <= tl.LIVE_MAX_WINDOW + 1.0 + WORD
+
+    assert committed, "oltre LIVE_MAX_WINDOW il commit deve essere forzato"
+    assert live.offset > 0
+    starts = [s["start"] for s in committed]
+    assert starts == sorted(set(starts))
+    for prev, cur in zip(committed, committed[1:]):
+        assert cur["start"] >= prev["end"] - 1e-6
+
+
+def test_silence_is_dropped_past_max_window():
+    live = tl.LiveTranscriber(RunModel(), latency=1.0)
+    _feed(live, np.zeros(int(40 * SR), dtype=np.float32), 1.0)
+    assert len(live.buffer) / SR <= tl.LIVE_MAX_WINDOW + 1.0
+    assert live.offset > 0
+    assert live.committed == []
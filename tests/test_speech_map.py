@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import trascrivi_locale as tl
+
+SR = tl.SAMPLE_RATE
+
+# parlato a 1-3 s e a 10-11 s: nel concatenato la seconda regione parte a 2 s
+REGIONS = [{"start": 1 * SR, "end": 3 * SR}, {"start": 10 * SR, "end": 11 * SR}]
+
+
+def test_time_inside_first_region():
+    m = tl.SpeechMap(REGIONS)
+    assert m.original_time(0.0) == pytest.approx(1.0)
+    assert m.original_time(1.5) == pytest.approx(2.5)
+
+
+def test_region_boundary_start_vs_end():
+    m = tl.SpeechMap(REGIONS)
+    # un inizio sul confine appartiene alla regione successiva, una fine alla precedente
+    assert m.original_time(2.0) == pytest.approx(10.0)
+    assert m.original_time(2.0, is_end=True) == pytest.approx(3.0)
+
+
+def test_time_inside_later_region():
+    m = tl.SpeechMap(REGIONS)
+    assert m.original_time(2.5) == pytest.approx(10.5)
+    assert m.original_time(2.5, is_end=True) == pytest.approx(10.5)
+    assert m.original_time(3.0, is_end=True) == pytest.approx(11.0)
+
+
+def test_collect_joins_only_speech():
+    np = pytest.importorskip("numpy")
+    audio = np.arange(12 * SR, dtype=np.float32)
+    joined = tl.SpeechMap(REGIONS).collect(audio)
+    assert len(joined) == 3 * SR
+    assert joined[0] == 1 * SR and joined[2 * SR] == 10 * SR
+    assert len(tl.SpeechMap([]).collect(audio)) == 0
@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import time
+import signal
+import multiprocessing
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import trascrivi_locale as tl
+
+
+def _enqueue(spool, tmp_path, n):
+    ids = []
+    for i in range(n):
+        p = str(tmp_path / f"media{i}.mp3")
+        spool.enqueue(p, {})
+        ids.append(tl.Spool.job_id(p))
+    return ids
+
+
+def _claim(spool, job_id):
+    # con più job pending claim() sceglie a caso: si riprova finché esce quello voluto
+    others = []
+    while True:
+        lease = spool.claim("a")
+        if lease.job_id == job_id:
+            break
+        others.append(lease)
+    for other in others:
+        spool.release(other)
+    return lease
+
+
+def test_ttl_is_fixed_by_spool_creator(tmp_path):
+    assert tl.Spool(str(tmp_path), ttl=5).ttl == 5
+    assert tl.Spool(str(tmp_path), ttl=99).ttl == 5
+    assert tl.Spool(str(tmp_path)).ttl == 5
+
+
+def test_enqueue_is_idempotent(tmp_path):
+    spool = tl.Spool(str(tmp_path / "spool"))
+    media = str(tmp_path / "a.mp3")
+    assert spool.enqueue(media, {}) is True
+    assert spool.enqueue(media, {}) is False
+    assert len(spool.job_ids()) == 1
+
+
+def test_fresh_lease_is_not_claimed_twice(tmp_path):
+    spool = tl.Spool(str(tmp_path / "spool"), ttl=60)
+    _enqueue(spool, tmp_path, 1)
+    lease = spool.claim("a")
+    assert lease is not None and lease.gen == 1
+    assert spool.claim("b") is None
+
+
+def test_reclaim_after_expiry_fences_old_holder(tmp_path):
+    spool = tl.Spool(str(tmp_path / "spool"), ttl=60)
+    [job_id] = _enqueue(spool, tmp_path, 1)
+    old = spool.claim("a")
+    old.expire()
+
+    new = spool.claim("b")
+    assert new is not None and new.gen == 2
+    assert not old.still_held()
+    assert new.still_held()
+
+    # il vecchio titolare non può più fare commit, il nuovo sì, una volta sola
+    assert spool.commit(old, {"status": "ok"}) is False
+    assert spool.commit(new, {"status": "ok", "owner": "b"}) is True
+    assert spool.commit(new, {"status": "ok", "owner": "b"}) is False
+    with open(spool.done_path(job_id), encoding="utf-8") as f:
+        assert json.load(f)["owner"] == "b"
+    assert spool.pending() == []
+    assert not os.path.exists(spool.lease_dir(job_id))
+
+
+def test_heartbeat_notices_superseded_lease(tmp_path):
+    spool = tl.Spool(str(tmp_path / "spool"), ttl=60)
+    _enqueue(spool, tmp_path, 1)
+    old = spool.claim("a")
+    old.expire()
+    assert spool.claim("b") is not None
+
+    old.start_heartbeat(0.02)
+    assert old.lost.wait(2.0)
+    old.stop_heartbeat()
+
+
+def test_failed_after_max_attempts(tmp_path):
+    spool = tl.Spool(str(tmp_path / "spool"), ttl=60)
+    [job_id] = _enqueue(spool, tmp_path, 1)
+    for attempt in range(1, tl.LEASE_MAX_ATTEMPTS + 1):
+        lease = spool.claim("a")
+        assert lease.gen == attempt
+        lease.expire()
+    assert spool.claim("a") is None
+    with open(spool.done_path(job_id), encoding="utf-8") as f:
+        assert json.load(f)["status"] == "failed"
+    assert spool.pending() == []
+
+
+def test_retry_failed_requeues_only_failed_jobs(tmp_path):
+    spool = tl.Spool(str(tmp_path / "spool"), ttl=60)
+    failed, ok = _enqueue(spool, tmp_path, 2)
+    assert spool.commit(_claim(spool, ok), {"status": "ok"}) is True
+    for _ in range(tl.LEASE_MAX_ATTEMPTS):
+        _claim(spool, failed).expire()
+    assert spool.claim("a") is None
+    assert spool.pending() == []
+
+    assert spool.retry_failed() == 1
+    assert spool.pending() == [failed]
+    lease = spool.claim("a")
+    assert lease.job_id == failed and lease.gen == 1
+    assert spool.retry_failed() == 0
+
+
+def test_unreadable_job_counts_as_attempt(tmp_path):
+    spool = tl.Spool(str(tmp_path / "spool"), ttl=60)
+    open(os.path.join(spool.root, "jobs", "broken.json"), "w").close()
+    for _ in range(tl.LEASE_MAX_ATTEMPTS + 1):
+        assert spool.claim("a") is None
+    assert spool.is_done("broken")
+    assert spool.pending() == []
+
+
+def _worker(root, name, die_after):
+    spool = tl.Spool(root)
+    claimed = 0
+    while True:
+        lease = spool.claim(name)
+        if lease is None:
+            if not spool.pending():
+                return
+            time.sleep(0.05)
+            continue
+        lease.start_heartbeat(spool.ttl / 4)
+        claimed += 1
+        if claimed == die_after:
+            os.kill(os.getpid(), signal.SIGKILL)
+        time.sleep(0.1)
+
+        def outputs():
+            with open(os.path.join(root, "commits.log"), "a") as f:
+                f.write(lease.job_id + "\n")
+            return []
+        if not lease.lost.is_set():
+            spool.commit(lease, {"status": "ok", "owner": name}, write_outputs=outputs)
+        lease.stop_heartbeat()
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGKILL") or "fork" not in multiprocessing.get_all_start_methods(),
+                    reason="richiede fork e SIGKILL")
+def test_several_workers_with_a_killed_one(tmp_path):
+    root = str(tmp_path / "spool")
+    spool = tl.Spool(root, ttl=0.5)
+    ids = _enqueue(spool, tmp_path, 20)
+
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_worker, args=(root, f"w{i}", 2 if i == 0 else 0)) for i in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+
+    assert procs[0].exitcode == -signal.SIGKILL
+    assert [p.exitcode for p in procs[1:]] == [0, 0, 0]
+    with open(os.path.join(root, "commits.log")) as f:
+        commits = f.read().split()
+    assert sorted(commits) == sorted(ids)
+    assert spool.pending() == []
@@ -1,12 +1,19 @@
 import os
 import time
 import json
+import uuid
+import atexit
+import bisect
+import queue
 import threading
 import tempfile
 import subprocess
-import tkinter as tk
-from tkinter import filedialog, messagebox
-from tkinter import ttk
+try:
+    import tkinter as tk
+    from tkinter import filedialog, messagebox
+    from tkinter import ttk
+except ImportError:  # Python senza _tkinter (server): restano le modalità headless
+    tk = None
 
 # =======================
 #   UTILS (Logica invariata)
@@ -15,6 +22,12 @@ from tkinter import ttk
 AUDIO_EXT = (".mp3", ".wav", ".m4a", ".flac", ".ogg")
 VIDEO_EXT = (".mp4", ".mkv", ".mov", ".avi")
 
+SAMPLE_RATE   = 16000
+DRAFT_MODELS  = ("tiny", "base")
+DRAFT_MODEL   = "tiny"
+DRAFT_DECODE  = {"beam_size": 1, "temperature": 0.0}
+REFINE_AHEAD  = 4   # file al massimo con l'audio decodificato in attesa di rifinitura
+
 def format_timestamp(seconds: float) -> str:
     ms = int(round((seconds - int(seconds)) * 1000))
     seconds = int(seconds)
@@ -23,25 +36,128 @@ def format_timestamp(seconds: float) -> str:
     hours = seconds // 3600
     return f"{hours:02d}:{minutes:02d}:{s:02d},{ms:03d}"
 
+def srt_block(i, seg) -> str:
+    return (f"{i}\n"
+            f"{format_timestamp(seg['start'])} --> {format_timestamp(seg['end'])}\n"
+            f"{seg['text'].strip()}\n\n")
+
+def vtt_block(seg) -> str:
+    return (f"{format_timestamp(seg['start']).replace(',', '.')} --> {format_timestamp(seg['end']).replace(',', '.')}\n"
+            f"{seg['text'].strip()}\n\n")
+
 def write_srt(segments, out_path):
     with open(out_path, "w", encoding="utf-8") as f:
         for i, seg in enumerate(segments, start=1):
-            f.write(f"{i}\n")
-            f.write(f"{format_timestamp(seg['start'])} --> {format_timestamp(seg['end'])}\n")
-            f.write(seg['text'].strip() + "\n\n")
+            f.write(srt_block(i, seg))
 
 def write_vtt(segments, out_path):
     with open(out_path, "w", encoding="utf-8") as f:
         f.write("WEBVTT\n\n")
         for seg in segments:
-            f.write(f"{format_timestamp(seg['start']).replace(',', '.')} --> {format_timestamp(seg['end']).replace(',', '.')}\n")
-            f.write(seg['text'].strip() + "\n\n")
+            f.write(vtt_block(seg))
 
 def write_txt_segmented(segments, out_path):
     with open(out_path, "w", encoding="utf-8") as f:
         for seg in segments:
             f.write(f"[{format_timestamp(seg['start'])}–{format_timestamp(seg['end'])}] {seg['text'].strip()}\n")
 
+def decode_options(preset: str) -> dict:
+    if preset == "Fast":
+        return {"beam_size": 1, "temperature": 0.5}
+    elif preset == "Accurate":
+        return {"beam_size": 5, "temperature": 0.0}
+    else:  # Balanced
+        return {"beam_size": 3, "temperature": 0.2}
+
+def transcribe_segments(model, source, task, language, decode, speech_map=None, stop=None, on_progress=None):
+    # con speech_map, source è già il solo parlato concatenato (load_shared_audio):
+    # il VAD interno si spegne e i tempi vengono riportati sull'audio originale
+    if speech_map is not None and not speech_map.chunks:
+        return []  # nessun parlato rilevato dal VAD: niente da trascrivere
+    vad = {"vad_filter": speech_map is None}
+
+    segments_out = []
+    gen, info = model.transcribe(
+        source,
+        task="translate" if task == "translate" else "transcribe",
+        language=None if task == "translate" else language,
+        **vad,
+        **decode
+    )
+    for seg in gen:
+        if stop is not None and stop.is_set():
+            break
+        if on_progress and seg.end:
+            on_progress(float(seg.end))
+        start, end = float(seg.start or 0.0), float(seg.end or 0.0)
+        if speech_map is not None:
+            start, end = speech_map.original_time(start), speech_map.original_time(end, is_end=True)
+        segments_out.append({"start": start, "end": end, "text": seg.text or ""})
+    return segments_out
+
+def _atomic_write(writer, segments, out_path):
+    # scrive su file temporaneo e sostituisce: chi legge vede sempre un file completo.
+    # Nome temporaneo univoco: più processi possono scrivere lo stesso output
+    tmp = f"{out_path}.{uuid.uuid4().hex[:8]}.part"
+    writer(segments, tmp)
+    os.replace(tmp, out_path)
+
+def _write_plain_txt(segments, out_path):
+    full_text = "".join(seg["text"] for seg in segments).strip()
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write(full_text + "\n")
+
+def save_outputs(base: str, segments, cfg) -> list:
+    outs = []
+    for key, suffix, writer in (("save_txt", ".txt", _write_plain_txt),
+                                ("save_txt_seg", ".segments.txt", write_txt_segmented),
+                                ("save_srt", ".srt", write_srt),
+                                ("save_vtt", ".vtt", write_vtt)):
+        if cfg[key]:
+            p = f"{base}{suffix}"
+            _atomic_write(writer, segments, p)
+            outs.append(p)
+    return outs
+
+class SpeechMap:
+    # regioni di parlato rilevate dal VAD (in campioni sull'audio originale).
+    # Come vad_filter=True di faster-whisper: il modello vede solo il parlato
+    # concatenato, e i tempi del concatenato vanno riportati all'originale
+    def __init__(self, chunks):
+        self.chunks = [(int(c["start"]), int(c["end"])) for c in chunks]
+        self._joined_starts = []
+        self._original_starts = []
+        pos = 0
+        for start, end in self.chunks:
+            self._joined_starts.append(pos / SAMPLE_RATE)
+            self._original_starts.append(start / SAMPLE_RATE)
+            pos += end - start
+
+    def collect(self, audio):
+        import numpy as np
+        if not self.chunks:
+            return audio[:0]
+        return np.concatenate([audio[start:end] for start, end in self.chunks])
+
+    def original_time(self, t: float, is_end: bool = False) -> float:
+        # una fine che cade esattamente sul confine appartiene alla regione precedente
+        find = bisect.bisect_left if is_end else bisect.bisect_right
+        i = max(0, find(self._joined_starts, t) - 1)
+        return self._original_starts[i] + (t - self._joined_starts[i])
+
+def load_shared_audio(path: str):
+    # decodifica una sola volta + mappa VAD, condivise tra bozza e rifinitura.
+    # Restituisce (speech, speech_map): il parlato concatenato e la sua mappa,
+    # oppure l'audio intero e None se il VAD non è disponibile (si ripiega su vad_filter)
+    from faster_whisper.audio import decode_audio
+    audio = decode_audio(path, sampling_rate=SAMPLE_RATE)
+    try:
+        from faster_whisper.vad import VadOptions, get_speech_timestamps
+        speech_map = SpeechMap(get_speech_timestamps(audio, VadOptions()))
+    except Exception:
+        return audio, None
+    return speech_map.collect(audio), speech_map
+
 def hhmmss(secs: float) -> str:
     secs = max(0, int(round(secs)))
     h = secs // 3600
@@ -84,11 +200,542 @@ def make_clip(src: str, seconds: int) -> str:
         )
         return tmp_wav
 
+# =======================
+#   LIVE (STREAMING)
+# =======================
+
+LIVE_MAX_WINDOW = 25.0   # secondi: oltre si forza il commit (Whisper lavora su finestre da 30s)
+LIVE_GUARD      = 0.5    # secondi: segmenti che finiscono troppo vicino al bordo non sono stabili
+
+def open_pcm_stream(source: str, pcm: bool = False, follow: bool = False,
+                    realtime: bool = False, idle_timeout: float = 10.0):
+    # qualunque input leggibile da ffmpeg -> PCM s16le 16 kHz mono su stdout.
+    # source "-" = stdin; pcm = input già grezzo s16le 16 kHz mono;
+    # follow = file ancora in registrazione; realtime = replay a velocità reale (-re)
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+    if source != "-":
+        cmd += ["-nostdin"]
+    if realtime:
+        cmd += ["-re"]
+    if pcm:
+        cmd += ["-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1"]
+    if source == "-":
+        src = "pipe:0"
+    elif follow:
+        # il protocollo file riprova in coda al file; rw_timeout chiude dopo inattività
+        cmd += ["-follow", "1", "-rw_timeout", str(int(idle_timeout * 1e6))]
+        src = "file:" + os.path.abspath(source)
+    else:
+        src = source
+    cmd += ["-i", src, "-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1", "pipe:1"]
+    return subprocess.Popen(cmd, stdin=None if source == "-" else subprocess.DEVNULL,
+                            stdout=subprocess.PIPE)
+
+def _norm_text(text: str) -> str:
+    return " ".join(text.lower().split())
+
+class RollingSubtitles:
+    # output SRT/VTT aperti in append: ogni segmento confermato viene scritto
+    # subito, così un player o un overlay può seguire il file mentre cresce
+    def __init__(self, base: str, save_srt: bool = True, save_vtt: bool = True):
+        self.count = 0
+        self.files = []
+        if save_srt:
+            self.srt = open(f"{base}.srt", "w", encoding="utf-8")
+            self.files.append(self.srt)
+        else:
+            self.srt = None
+        if save_vtt:
+            self.vtt = open(f"{base}.vtt", "w", encoding="utf-8")
+            self.vtt.write("WEBVTT\n\n")
+            self.vtt.flush()
+            self.files.append(self.vtt)
+        else:
+            self.vtt = None
+
+    def append(self, seg):
+        self.count += 1
+        if self.srt:
+            self.srt.write(srt_block(self.count, seg))
+        if self.vtt:
+            self.vtt.write(vtt_block(seg))
+        for f in self.files:
+            f.flush()
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+class LiveTranscriber:
+    # decoder a finestra scorrevole: ogni `latency` secondi di audio nuovo
+    # ritrascrive il buffer non ancora confermato. I segmenti uguali in due
+    # ipotesi consecutive (e lontani dal bordo) vengono confermati e tolti dal
+    # buffer; il resto è l'ipotesi parziale.
+    def __init__(self, model, task="transcribe", language=None, decode=None,
+                 latency=2.0, on_partial=None, on_commit=None):
+        self.model      = model
+        self.task       = task
+        self.language   = language
+        self.decode     = decode or {"beam_size": 1, "temperature": 0.0}
+        self.step       = max(1, int(latency * SAMPLE_RATE))
+        self.on_partial = on_partial
+        self.on_commit  = on_commit
+
+        self.buffer     = None
+        self.offset     = 0.0      # tempo assoluto dell'inizio del buffer
+        self.pending    = 0        # campioni arrivati dall'ultima decodifica
+        self.prev_hyp   = []
+        self.committed  = []
+
+    def feed(self, samples):
+        import numpy as np
+        self.buffer = samples if self.buffer is None else np.concatenate([self.buffer, samples])
+        self.pending += len(samples)
+        if self.pending >= self.step:
+            self.pending = 0
+            self._process(final=False)
+
+    def finish(self):
+        if self.buffer is not None and len(self.buffer):
+            self._process(final=True)
+        if self.on_partial:
+            self.on_partial("")
+
+    def _hypothesis(self):
+        prompt = " ".join(seg["text"].strip() for seg in self.committed[-3:]) or None
+        gen, info = self.model.transcribe(
+            self.buffer,
+            task="translate" if self.task == "translate" else "transcribe",
+            language=None if self.task == "translate" else self.language,
+            vad_filter=True,
+            condition_on_previous_text=False,
+            initial_prompt=prompt,
+            **self.decode
+        )
+        return [{"start": self.offset + float(seg.start or 0.0),
+                 "end": self.offset + float(seg.end or 0.0),
+                 "text": seg.text or ""} for seg in gen if (seg.text or "").strip()]
+
+    def _process(self, final: bool):
+        hyp = self._hypothesis()
+        buffer_end = self.offset + len(self.buffer) / SAMPLE_RATE
+
+        if final:
+            n_stable = len(hyp)
+        else:
+            n_stable = 0
+            for cur, prev in zip(hyp, self.prev_hyp):
+                if _norm_text(cur["text"]) != _norm_text(prev["text"]) or cur["end"] > buffer_end - LIVE_GUARD:
+                    break
+                n_stable += 1
+            # buffer troppo lungo: si conferma tutto tranne l'ultimo segmento
+            if buffer_end - self.offset > LIVE_MAX_WINDOW:
+                n_stable = max(n_stable, len(hyp) - 1 if len(hyp) > 1 else len(hyp))
+
+        for seg in hyp[:n_stable]:
+            self.committed.append(seg)
+            if self.on_commit:
+                self.on_commit(seg)
+
+        if n_stable:
+            cut = max(0, int((hyp[n_stable - 1]["end"] - self.offset) * SAMPLE_RATE))
+            self.buffer = self.buffer[cut:]
+            self.offset += cut / SAMPLE_RATE
+        elif not hyp and buffer_end - self.offset > LIVE_MAX_WINDOW:
+            # solo silenzio: si scarta tutto tranne la coda
+            keep = int(LIVE_GUARD * SAMPLE_RATE)
+            cut = max(0, len(self.buffer) - keep)
+            self.buffer = self.buffer[cut:]
+            self.offset += cut / SAMPLE_RATE
+
+        self.prev_hyp = hyp[n_stable:]
+        if self.on_partial:
+            self.on_partial("".join(seg["text"] for seg in self.prev_hyp).strip())
+
+def run_live(args) -> int:
+    import sys
+    import shutil
+    import numpy as np
+    try:
+        from faster_whisper import WhisperModel
+    except Exception as e:
+        print(f"faster-whisper non è installato: {e}", file=sys.stderr)
+        return 1
+    if shutil.which("ffmpeg") is None:
+        print("FFmpeg non trovato. Installa FFmpeg e aggiungi al PATH.", file=sys.stderr)
+        return 1
+
+    model = WhisperModel(args.model, device="auto", compute_type=args.compute_type)
+    base = args.out or os.path.splitext(args.stream)[0] + ".live"
+
+    def on_partial(text):
+        if sys.stderr.isatty():
+            sys.stderr.write("\r\033[K" + text[-120:])
+            sys.stderr.flush()
+
+    def on_commit(seg):
+        subs.append(seg)
+        if sys.stderr.isatty():
+            sys.stderr.write("\r\033[K")
+        print(f"[{format_timestamp(seg['start'])}–{format_timestamp(seg['end'])}] {seg['text'].strip()}", flush=True)
+
+    live = LiveTranscriber(model, task=args.task, language=(args.language.strip() or None), latency=args.latency,
+                           on_partial=on_partial, on_commit=on_commit)
+    proc = open_pcm_stream(args.stream, pcm=args.pcm, follow=args.follow, realtime=args.realtime)
+    subs = RollingSubtitles(base, save_srt=not args.no_srt, save_vtt=not args.no_vtt)
+    decoded = 0
+    chunk_bytes = 2 * max(1, int(args.latency * SAMPLE_RATE / 4))
+
+    # la lettura da ffmpeg non deve mai fermarsi durante una decodifica,
+    # altrimenti la pipe si riempie e la sorgente live si blocca o perde audio
+    blocks = queue.Queue()
+    def pump():
+        while True:
+            data = proc.stdout.read(chunk_bytes)
+            if not data:
+                break
+            blocks.put(data)
+        blocks.put(None)
+    threading.Thread(target=pump, daemon=True).start()
+
+    try:
+        ended = False
+        while not ended:
+            # tutto ciò che è arrivato durante l'ultima decodifica entra in un
+            # unico feed: al massimo una decodifica per passo, il ritardo non cresce
+            pending = [blocks.get()]
+            while True:
+                try: pending.append(blocks.get_nowait())
+                except queue.Empty: break
+            if pending[-1] is None:
+                ended = True
+                pending.pop()
+            data = b"".join(pending)
+            data = data[:len(data) // 2 * 2]
+            if data:
+                decoded += len(data) // 2
+                live.feed(np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0)
+        live.finish()
+        proc.wait()
+    except KeyboardInterrupt:
+        live.finish()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        subs.close()
+
+    # percorso errato, stream illeggibile, timeout di --follow senza dati:
+    # niente sottotitoli vuoti spacciati per successo
+    if proc.returncode and not decoded:
+        print(f"ffmpeg terminato con codice {proc.returncode}: nessun audio letto da {args.stream}", file=sys.stderr)
+        for ext in (".srt", ".vtt"):
+            try: os.remove(base + ext)
+            except OSError: pass
+        return 1
+    return 0
+
+# =======================
+#   SPOOL DISTRIBUITO
+# =======================
+
+LEASE_TTL          = 60.0   # secondi senza heartbeat dopo i quali un lease è scaduto
+LEASE_MAX_ATTEMPTS = 3      # tentativi per job prima di marcarlo come fallito
+
+class Lease:
+    # lease = spool/leases/<job_id>/<generazione>, creato con O_EXCL.
+    # Chi reclama un lease scaduto crea la generazione successiva: solo uno ci
+    # riesce, e il vecchio titolare se ne accorge al primo heartbeat.
+    def __init__(self, spool, job_id, gen, job):
+        self.spool  = spool
+        self.job_id = job_id
+        self.gen    = gen
+        self.job    = job
+        self.path   = os.path.join(spool.lease_dir(job_id), f"{gen:06d}")
+        self.lost   = threading.Event()
+        self._stop  = threading.Event()
+        self._hb    = None
+
+    def still_held(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        return self.spool.lease_gens(self.job_id)[-1:] == [self.gen]
+
+    def start_heartbeat(self, interval: float):
+        def beat():
+            while not self._stop.wait(interval):
+                try:
+                    if not self.still_held():
+                        self.lost.set()
+                        return
+                    os.utime(self.path, None)
+                except OSError:
+                    self.lost.set()
+                    return
+        self._hb = threading.Thread(target=beat, daemon=True)
+        self._hb.start()
+
+    def stop_heartbeat(self):
+        self._stop.set()
+        if self._hb:
+            self._hb.join()
+
+    def expire(self):
+        # errore durante il job: lease subito riprendibile (anche da noi)
+        try: os.utime(self.path, (0, 0))
+        except OSError: pass
+
+class Spool:
+    # cartella condivisa:
+    #   config.json        parametri comuni a tutti i worker (TTL dei lease)
+    #   jobs/<id>.json     job in coda (percorso assoluto del media + cfg)
+    #   leases/<id>/<gen>  lease con heartbeat (mtime)
+    #   done/<id>.json     commit del risultato, creato una sola volta
+    def __init__(self, root: str, ttl: float = None):
+        self.root = os.path.abspath(root)
+        for sub in ("jobs", "leases", "done"):
+            os.makedirs(os.path.join(self.root, sub), exist_ok=True)
+        # il TTL vale per tutto lo spool e lo fissa chi lo crea: heartbeat e
+        # scadenza devono essere uguali su tutti i nodi, altrimenti un worker
+        # con TTL corto ruba i lease vivi di quelli più lenti
+        config = os.path.join(self.root, "config.json")
+        self._create_exclusive(config, {"lease_ttl": float(ttl or LEASE_TTL)})
+        with open(config, encoding="utf-8") as f:
+            self.ttl = float(json.load(f)["lease_ttl"])
+
+    @staticmethod
+    def job_id(path: str) -> str:
+        import hashlib
+        return hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+
+    def lease_dir(self, job_id: str) -> str:
+        return os.path.join(self.root, "leases", job_id)
+
+    def done_path(self, job_id: str) -> str:
+        return os.path.join(self.root, "done", f"{job_id}.json")
+
+    def lease_gens(self, job_id: str) -> list:
+        try:
+            names = os.listdir(self.lease_dir(job_id))
+        except FileNotFoundError:
+            return []
+        return sorted(int(n) for n in names if n.isdigit())
+
+    def job_ids(self) -> list:
+        return [n[:-5] for n in os.listdir(os.path.join(self.root, "jobs")) if n.endswith(".json")]
+
+    def is_done(self, job_id: str) -> bool:
+        return os.path.exists(self.done_path(job_id))
+
+    def pending(self) -> list:
+        return [j for j in self.job_ids() if not self.is_done(j)]
+
+    def enqueue(self, path: str, cfg: dict) -> bool:
+        # idempotente: lo stesso file (percorso assoluto) produce lo stesso job.
+        # La scrittura è atomica (_create_exclusive), quindi un enqueue
+        # interrotto non lascia job vuoti o troncati
+        job_id = self.job_id(path)
+        job = {"path": os.path.abspath(path), "cfg": cfg}
+        return self._create_exclusive(os.path.join(self.root, "jobs", f"{job_id}.json"), job)
+
+    def retry_failed(self) -> int:
+        # rimette in coda i job chiusi senza successo (tentativi esauriti);
+        # prima si azzerano i lease, così i tentativi ripartono da 1, poi si
+        # toglie il marker done che li teneva fuori dalla coda
+        import shutil
+        retried = 0
+        for job_id in self.job_ids():
+            try:
+                with open(self.done_path(job_id), encoding="utf-8") as f:
+                    status = json.load(f).get("status")
+            except (OSError, ValueError):
+                continue
+            if status == "ok":
+                continue
+            shutil.rmtree(self.lease_dir(job_id), ignore_errors=True)
+            try: os.remove(self.done_path(job_id))
+            except OSError: continue
+            retried += 1
+        return retried
+
+    def _create_exclusive(self, path: str, payload: dict) -> bool:
+        # file scritto per intero su un temporaneo e poi pubblicato con
+        # os.link, che fallisce se la destinazione esiste: chi legge non vede
+        # mai un file vuoto o troncato, e solo un processo vince
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.part"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp)
+        return True
+
+    def _fs_now(self, owner: str) -> float:
+        # orologio del filesystem condiviso: gli mtime dei lease arrivano dal
+        # server, quindi vanno confrontati con un mtime e non con time.time()
+        probe = os.path.join(self.root, f".clock-{owner}")
+        with open(probe, "w"):
+            pass
+        return os.stat(probe).st_mtime
+
+    def claim(self, owner: str):
+        import random
+        ids = self.pending()
+        random.shuffle(ids)  # worker diversi partono da job diversi
+        now = self._fs_now(owner) if ids else 0.0
+        for job_id in ids:
+            gens = self.lease_gens(job_id)
+            if gens:
+                try:
+                    if now - os.stat(os.path.join(self.lease_dir(job_id), f"{gens[-1]:06d}")).st_mtime < self.ttl:
+                        continue
+                except FileNotFoundError:
+                    continue
+            gen = (gens[-1] if gens else 0) + 1
+            os.makedirs(self.lease_dir(job_id), exist_ok=True)
+            info = {"owner": owner, "claimed": time.time()}
+            if not self._create_exclusive(os.path.join(self.lease_dir(job_id), f"{gen:06d}"), info):
+                continue
+            lease = Lease(self, job_id, gen, None)
+            if self.is_done(job_id):
+                self.release(lease)
+                continue
+            if gen > LEASE_MAX_ATTEMPTS:
+                self.commit(lease, {"status": "failed", "owner": owner,
+                                    "error": f"superati {LEASE_MAX_ATTEMPTS} tentativi"})
+                continue
+            try:
+                with open(os.path.join(self.root, "jobs", f"{job_id}.json"), encoding="utf-8") as f:
+                    lease.job = json.load(f)
+            except (OSError, ValueError):
+                # job illeggibile = tentativo fallito: il lease resta (la
+                # generazione conta i tentativi) ma scade subito
+                lease.expire()
+                continue
+            return lease
+        return None
+
+    def commit(self, lease: Lease, result: dict, write_outputs=None) -> bool:
+        # fencing: si scrive solo se il lease è ancora nostro e nessuno ha già
+        # fatto commit; gli output sono atomici, il marker done è O_EXCL
+        if not lease.still_held() or self.is_done(lease.job_id):
+            return False
+        if write_outputs:
+            result["outputs"] = write_outputs()
+        ok = self._create_exclusive(self.done_path(lease.job_id), result)
+        self.release(lease)
+        return ok
+
+    def release(self, lease: Lease):
+        import shutil
+        if self.is_done(lease.job_id):
+            shutil.rmtree(self.lease_dir(lease.job_id), ignore_errors=True)
+        else:
+            try: os.remove(lease.path)
+            except OSError: pass
+
+def run_worker(args) -> int:
+    import sys
+    import socket
+    try:
+        from faster_whisper import WhisperModel
+    except Exception as e:
+        print(f"faster-whisper non è installato: {e}", file=sys.stderr)
+        return 1
+
+    spool = Spool(args.worker, ttl=args.lease_ttl)
+    if args.lease_ttl and args.lease_ttl != spool.ttl:
+        print(f"--lease-ttl ignorato: lo spool usa {spool.ttl:g} s", file=sys.stderr)
+    owner = f"{socket.gethostname()}-{os.getpid()}"
+    models = {}
+    failures = 0  # errori consecutivi: back-off prima di riprendere un job
+
+    while True:
+        lease = spool.claim(owner)
+        if lease is None:
+            if not args.watch and not spool.pending():
+                break
+            time.sleep(min(5.0, spool.ttl / 4))
+            continue
+
+        path, cfg = lease.job["path"], lease.job["cfg"]
+        print(f"[{owner}] {os.path.basename(path)} (tentativo {lease.gen})", flush=True)
+
+        # un modello che non si carica è un problema del nodo, non del file:
+        # il lease torna libero senza consumare il tentativo e il worker si ferma
+        key = (cfg["model_name"], cfg["compute_type"])
+        if key not in models:
+            try:
+                models[key] = WhisperModel(cfg["model_name"], device="auto", compute_type=cfg["compute_type"])
+            except Exception as e:
+                print(f"[{owner}] errore caricamento modello '{cfg['model_name']}': {e}", file=sys.stderr, flush=True)
+                spool.release(lease)
+                return 1
+
+        lease.start_heartbeat(spool.ttl / 4)
+        try:
+            # media non raggiungibile (es. mount condiviso assente su questo
+            # nodo): tentativo fallito, non un esito definitivo
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"file non trovato: {path}")
+            segments_out = transcribe_segments(models[key], path, cfg["task"], cfg["language"],
+                                               decode_options(cfg["preset"]), stop=lease.lost)
+            if lease.lost.is_set():
+                print(f"[{owner}] lease perso: {os.path.basename(path)}", file=sys.stderr, flush=True)
+                continue
+            base, _ = os.path.splitext(path)
+            spool.commit(lease, {"status": "ok", "owner": owner},
+                         write_outputs=lambda: save_outputs(base, segments_out, cfg))
+            failures = 0
+        except Exception as e:
+            print(f"[{owner}] errore su {os.path.basename(path)}: {e}", file=sys.stderr, flush=True)
+            lease.expire()
+            failures += 1
+        finally:
+            lease.stop_heartbeat()
+        if failures:
+            time.sleep(min(spool.ttl, 2.0 ** failures))
+
+    try: os.remove(os.path.join(spool.root, f".clock-{owner}"))
+    except OSError: pass
+    return 0
+
+def run_enqueue(args) -> int:
+    import sys
+    spool = Spool(args.enqueue, ttl=args.lease_ttl)
+    formats = {f.strip().lower() for f in args.formats.split(",")}
+    cfg = {
+        "model_name": args.model,
+        "task": args.task,
+        "language": (args.language.strip() or None),
+        "compute_type": args.compute_type,
+        "preset": args.preset,
+        "save_txt": "txt" in formats,
+        "save_srt": "srt" in formats,
+        "save_vtt": "vtt" in formats,
+        "save_txt_seg": "segments" in formats,
+    }
+    if args.retry_failed:
+        print(f"{spool.retry_failed()} job falliti rimessi in coda in {spool.root}")
+    added = 0
+    for p in args.files:
+        ext = os.path.splitext(p.lower())[1]
+        if not os.path.isfile(p) or not (ext in AUDIO_EXT or ext in VIDEO_EXT):
+            print(f"ignorato: {p}", file=sys.stderr)
+            continue
+        added += spool.enqueue(p, cfg)
+    if args.files or not args.retry_failed:
+        print(f"{added} job aggiunti a {spool.root}")
+    return 0
+
 # =======================
 #   APP (FASTER-WHISPER)
 # =======================
 
-class WhisperGUI(tk.Tk):
+class WhisperGUI(tk.Tk if tk is not None else object):
     def __init__(self):
         super().__init__()
         self.title("Whisper Studio")
@@ -132,6 +779,7 @@ class WhisperGUI(tk.Tk):
         self.save_txt_seg   = tk.BooleanVar(value=False)
         self.speed_preset   = tk.StringVar(value="Balanced")
         self.compute_type   = tk.StringVar(value="auto")
+        self.two_pass       = tk.BooleanVar(value=False)
 
         # ETA/Progress logic vars
         self.eta_thread      = None
@@ -141,12 +789,16 @@ class WhisperGUI(tk.Tk):
         self.audio_total_sec = 0.0
         self.processed_audio_sec = 0.0
         self.output_dir      = None
+        self.refine_spool    = set()   # file .npy temporanei della rifinitura
 
         self.accel_label_var = tk.StringVar(value="Accelerator: CPU")
 
         self._build_ui()
         self._detect_accelerator()
 
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        atexit.register(self._cleanup_refine_spool)
+
     # ---------- STYLING ----------
     def _setup_styles(self):
         style = ttk.Style()
@@ -316,6 +968,9 @@ class WhisperGUI(tk.Tk):
         ttk.Label(opt_card, text="Velocità vs Qualità", style="Muted.TLabel").grid(row=4, column=0, columnspan=2, sticky="w", pady=(0, 2))
         ttk.Combobox(opt_card, textvariable=self.speed_preset, state="readonly", values=["Fast", "Balanced", "Accurate"]).grid(row=5, column=0, columnspan=2, sticky="ew", pady=(0, 5))
 
+        # Two-pass
+        ttk.Checkbutton(opt_card, text=f"Anteprima rapida (bozza '{DRAFT_MODEL}' + rifinitura)", variable=self.two_pass).grid(row=6, column=0, columnspan=2, sticky="w", pady=(5, 0))
+
         # -- Task & Output Card --
         out_card = ttk.Labelframe(right_col, text=" Task & Output ", style="Card.TLabelframe", padding=15)
         out_card.pack(fill="x")
@@ -461,6 +1116,7 @@ class WhisperGUI(tk.Tk):
             "language": (self.language.get().strip() or None),
             "compute_type": self.compute_type.get() or "auto",
             "preset": self.speed_preset.get(),
+            "two_pass": self.two_pass.get(),
             "save_txt": self.save_txt.get(),
             "save_srt": self.save_srt.get(),
             "save_vtt": self.save_vtt.get(),
@@ -509,13 +1165,18 @@ class WhisperGUI(tk.Tk):
             return
 
         # preset decoding
-        preset = cfg["preset"]
-        if preset == "Fast":
-            decode = {"beam_size": 1, "temperature": 0.5}
-        elif preset == "Accurate":
-            decode = {"beam_size": 5, "temperature": 0.0}
-        else:  # Balanced
-            decode = {"beam_size": 3, "temperature": 0.2}
+        decode = decode_options(cfg["preset"])
+
+        # modalità due passate: bozza con modello piccolo, rifinitura in background
+        if cfg["two_pass"] and model_name not in DRAFT_MODELS:
+            self.after(0, lambda: self.lbl_status.config(text=f"Caricamento modello bozza '{DRAFT_MODEL}'..."))
+            try:
+                draft_model = WhisperModel(DRAFT_MODEL, device="auto", compute_type=compute_type)
+            except Exception:
+                draft_model = None
+            if draft_model is not None:
+                self._run_two_pass(cfg, draft_model, model, decode)
+                return
 
         total_files = len(self.files_selected)
 
@@ -536,43 +1197,15 @@ class WhisperGUI(tk.Tk):
                        self.lbl_status.config(text=f"Analisi preliminare ({i}/{t}): {os.path.basename(p)}..."))
             rtf_est = self._mini_benchmark(model, path, task, language, bench_len, decode, model_name=model_name)
 
-            # progress determinato
-            if self.audio_total_sec and rtf_est:
-                self.progress_mode = "determinate"
-                self.after(0, lambda: self.progress.config(mode="determinate", maximum=100, value=0))
-            else:
-                self.progress_mode = "indeterminate"
-                self.after(0, lambda: self.progress.config(mode="indeterminate"))
-
-            # ETA thread
-            self.job_start_time = time.time()
-            self.eta_stop.clear()
-            self.eta_thread = threading.Thread(target=self._eta_updater_stream, args=(rtf_est,), daemon=True)
-            self.eta_thread.start()
+            self._start_progress(rtf_est)
 
             # trascrizione
             if self.stop_requested.is_set(): break
             self.after(0, lambda p=path, i=idx, t=total_files:
                        self.lbl_status.config(text=f"Elaborazione ({i}/{t}): {os.path.basename(p)}"))
 
-            segments_out = []
-            text_concat = []
             try:
-                gen, info = model.transcribe(
-                    path,
-                    task="translate" if task == "translate" else "transcribe",
-                    language=None if task == "translate" else language,
-                    vad_filter=True,
-                    **decode
-                )
-                for seg in gen:
-                    if self.stop_requested.is_set():
-                        break
-                    self.processed_audio_sec = float(seg.end or self.processed_audio_sec)
-                    segments_out.append({"start": float(seg.start or 0.0),
-                                         "end": float(seg.end or 0.0),
-                                         "text": seg.text or ""})
-                    text_concat.append(seg.text or "")
+                segments_out = self._transcribe_segments(model, path, task, language, decode, track_progress=True)
             except Exception as e:
                 self.after(0, lambda: self._finish_with_error(f"Errore trascrizione:\n{e}"))
                 self.eta_stop.set()
@@ -584,21 +1217,11 @@ class WhisperGUI(tk.Tk):
                 break
 
             # salvataggio
-            full_text = ("".join(text_concat)).strip()
-            outs = []
-            if cfg["save_txt"]:
-                p = f"{base}.txt"
-                with open(p, "w", encoding="utf-8") as f: f.write(full_text + "\n")
-                outs.append(p)
-            if cfg["save_txt_seg"]:
-                p = f"{base}.segments.txt"
-                write_txt_segmented(segments_out, p); outs.append(p)
-            if cfg["save_srt"]:
-                p = f"{base}.srt"
-                write_srt(segments_out, p); outs.append(p)
-            if cfg["save_vtt"]:
-                p = f"{base}.vtt"
-                write_vtt(segments_out, p); outs.append(p)
+            try:
+                save_outputs(base, segments_out, cfg)
+            except Exception as e:
+                self.after(0, lambda: self._finish_with_error(f"Errore salvataggio:\n{e}"))
+                return
 
             self.after(0, lambda: self.btn_open.config(state="normal"))
             self.after(0, lambda i=idx, t=total_files:
@@ -609,6 +1232,157 @@ class WhisperGUI(tk.Tk):
         else:
             self.after(0, lambda: self._finish_ok("Tutti i file sono stati elaborati con successo."))
 
+    def _run_two_pass(self, cfg, draft_model, model, decode):
+        import numpy as np
+
+        files = [p for p in self.files_selected if os.path.isfile(p)]
+        total_files = len(files)
+        jobs = queue.Queue()
+        errors = []
+        # la bozza corre molto più avanti della rifinitura: solo REFINE_AHEAD file
+        # tengono l'audio decodificato su disco, gli altri verranno ridecodificati
+        slots = threading.Semaphore(REFINE_AHEAD)
+
+        refiner = threading.Thread(target=self._refine_worker,
+                                   args=(model, jobs, slots, cfg, decode, total_files, errors), daemon=True)
+        refiner.start()
+
+        for idx, path in enumerate(files, start=1):
+            if self.stop_requested.is_set() or errors:
+                break
+
+            base, _ = os.path.splitext(path)
+            self.output_dir = os.path.dirname(path)
+            self.after(0, lambda p=path, i=idx, t=total_files:
+                       self.lbl_status.config(text=f"Bozza rapida ({i}/{t}): {os.path.basename(p)}"))
+
+            try:
+                audio, speech_map = load_shared_audio(path)
+                segments_out = self._transcribe_segments(draft_model, audio, cfg["task"], cfg["language"],
+                                                         DRAFT_DECODE, speech_map=speech_map)
+            except Exception as e:
+                errors.append(f"Errore bozza ({os.path.basename(path)}):\n{e}")
+                break
+
+            if self.stop_requested.is_set():
+                break
+
+            try:
+                save_outputs(base, segments_out, cfg)
+            except Exception as e:
+                errors.append(f"Errore salvataggio bozza ({os.path.basename(path)}):\n{e}")
+                break
+            self.after(0, lambda: self.btn_open.config(state="normal"))
+
+            # l'audio decodificato passa alla rifinitura tramite file temporaneo
+            # int16 (senza perdite: decode_audio parte da PCM a 16 bit)
+            spool = None
+            if slots.acquire(blocking=False):
+                try:
+                    fd, spool = tempfile.mkstemp(suffix=".npy")
+                    os.close(fd)
+                    self.refine_spool.add(spool)
+                    np.save(spool, np.clip(np.round(audio * 32768.0), -32768, 32767).astype(np.int16))
+                except Exception as e:
+                    if spool:
+                        try: os.remove(spool)
+                        except OSError: pass
+                        self.refine_spool.discard(spool)
+                    slots.release()
+                    errors.append(f"Errore file temporaneo ({os.path.basename(path)}):\n{e}")
+                    break
+            del audio
+            jobs.put((idx, path, spool, speech_map))
+
+        jobs.put(None)
+        refiner.join()
+
+        if errors:
+            self.after(0, lambda: self._finish_with_error(errors[0]))
+        elif self.stop_requested.is_set():
+            self.after(0, lambda: self._finish_with_error("Operazione annullata dall'utente. Le bozze già salvate restano su disco."))
+        else:
+            self.after(0, lambda: self._finish_ok("Tutti i file sono stati elaborati con successo."))
+
+    def _refine_worker(self, model, jobs, slots, cfg, decode, total_files, errors):
+        import numpy as np
+
+        # stima iniziale come nel fallback del mini-benchmark, poi l'ETA si adatta
+        rtf_est = 2.0
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            idx, path, spool, speech_map = job
+            try:
+                if self.stop_requested.is_set() or errors:
+                    continue
+                if spool:
+                    audio = np.load(spool).astype(np.float32) / 32768.0
+                else:
+                    audio, speech_map = load_shared_audio(path)
+                self.audio_total_sec = len(audio) / SAMPLE_RATE
+                self.processed_audio_sec = 0.0
+                self._start_progress(rtf_est)
+                self.after(0, lambda p=path, i=idx, t=total_files:
+                           self.lbl_status.config(text=f"Rifinitura ({i}/{t}): {os.path.basename(p)}"))
+
+                t0 = time.time()
+                segments_out = self._transcribe_segments(model, audio, cfg["task"], cfg["language"], decode,
+                                                         speech_map=speech_map, track_progress=True)
+                self.eta_stop.set()
+                if self.stop_requested.is_set():
+                    continue
+                if self.processed_audio_sec > 1e-3:
+                    rtf_est = (time.time() - t0) / self.processed_audio_sec
+
+                base, _ = os.path.splitext(path)
+                save_outputs(base, segments_out, cfg)
+                self.after(0, lambda i=idx, t=total_files:
+                           self.lbl_status.config(text=f"Rifinito file {i} di {t}."))
+            except Exception as e:
+                self.eta_stop.set()
+                errors.append(f"Errore rifinitura ({os.path.basename(path)}):\n{e}")
+            finally:
+                if spool:
+                    try: os.remove(spool)
+                    except OSError: pass
+                    self.refine_spool.discard(spool)
+                    slots.release()
+
+    def _cleanup_refine_spool(self):
+        for p in list(self.refine_spool):
+            try: os.remove(p)
+            except OSError: pass
+            self.refine_spool.discard(p)
+
+    def _on_close(self):
+        # la rifinitura gira in un thread daemon: i suoi temporanei vanno tolti qui
+        self.stop_requested.set()
+        self._cleanup_refine_spool()
+        self.destroy()
+
+    def _start_progress(self, rtf_est):
+        # progress determinato
+        if self.audio_total_sec and rtf_est:
+            self.progress_mode = "determinate"
+            self.after(0, lambda: self.progress.config(mode="determinate", maximum=100, value=0))
+        else:
+            self.progress_mode = "indeterminate"
+            self.after(0, lambda: self.progress.config(mode="indeterminate"))
+
+        # ETA thread
+        self.job_start_time = time.time()
+        self.eta_stop.clear()
+        self.eta_thread = threading.Thread(target=self._eta_updater_stream, args=(rtf_est,), daemon=True)
+        self.eta_thread.start()
+
+    def _transcribe_segments(self, model, source, task, language, decode, speech_map=None, track_progress=False):
+        def progress(end):
+            self.processed_audio_sec = end
+        return transcribe_segments(model, source, task, language, decode, speech_map=speech_map,
+                                   stop=self.stop_requested, on_progress=progress if track_progress else None)
+
     def _mini_benchmark(self, model, path, task, language, bench_len, decode, model_name="small"):
         clip = None
         try:
@@ -698,6 +1472,47 @@ class WhisperGUI(tk.Tk):
 # =======================
 #   RUN
 # =======================
+def build_arg_parser():
+    import argparse
+    ap = argparse.ArgumentParser(description="Whisper Studio. Senza argomenti avvia l'interfaccia grafica.")
+    ap.add_argument("--stream", metavar="SORGENTE",
+                    help="trascrizione live: '-' per stdin, una named pipe o un file in registrazione")
+    ap.add_argument("--out", metavar="BASE", help="percorso base per i file .srt/.vtt (default: <sorgente>.live)")
+    ap.add_argument("--model", default="small")
+    ap.add_argument("--compute-type", default="auto")
+    ap.add_argument("--task", choices=["transcribe", "translate"], default="transcribe")
+    ap.add_argument("--language", default="it")
+    ap.add_argument("--latency", type=float, default=2.0, help="secondi tra due ipotesi parziali (default: 2.0)")
+    ap.add_argument("--pcm", action="store_true", help="input grezzo s16le 16 kHz mono")
+    ap.add_argument("--follow", action="store_true", help="segui un file ancora in scrittura")
+    ap.add_argument("--realtime", action="store_true", help="leggi la sorgente a velocità reale (test offline)")
+    ap.add_argument("--no-srt", action="store_true")
+    ap.add_argument("--no-vtt", action="store_true")
+    ap.add_argument("--enqueue", metavar="SPOOL", help="aggiungi i FILE alla cartella spool condivisa")
+    ap.add_argument("--worker", metavar="SPOOL", help="elabora i job della cartella spool condivisa")
+    ap.add_argument("--preset", choices=["Fast", "Balanced", "Accurate"], default="Balanced")
+    ap.add_argument("--formats", default="txt,srt", help="output per --enqueue: txt,srt,vtt,segments (default: txt,srt)")
+    ap.add_argument("--lease-ttl", type=float, default=None,
+                    help=f"secondi senza heartbeat prima di riprendere un job; vale solo alla creazione dello spool (default: {LEASE_TTL:g})")
+    ap.add_argument("--retry-failed", action="store_true",
+                    help="con --enqueue: rimetti in coda i job falliti (tentativi esauriti)")
+    ap.add_argument("--watch", action="store_true", help="il worker resta in attesa di nuovi job invece di uscire")
+    ap.add_argument("files", nargs="*", metavar="FILE")
+    return ap
+
 if __name__ == "__main__":
+    import sys
+    args = build_arg_parser().parse_args()
+    if args.stream:
+        if args.stream == "-" and not args.out:
+            build_arg_parser().error("--out è obbligatorio quando si legge da stdin")
+        sys.exit(run_live(args))
+    if args.enqueue:
+        sys.exit(run_enqueue(args))
+    if args.worker:
+        sys.exit(run_worker(args))
+    if tk is None:
+        print("tkinter non è disponibile: usa --stream, --enqueue o --worker.", file=sys.stderr)
+        sys.exit(1)
     app = WhisperGUI()
     app.mainloop()
\ No newline at end of file